@@ -30,7 +30,6 @@ import time
 from numpy import arange, array, bmat, cross, dot, eye, hstack, zeros
 from numpy import cos, pi, sin
 from numpy.random import random, seed
-from threading import Lock
 
 import pymanoid
 
@@ -588,11 +587,8 @@ class COMTubePredictiveControl(pymanoid.Process):
             self.preview_control.solve()
             U = self.preview_control.U.flatten()
             dT = [self.preview_control.timestep] * self.nb_mpc_steps
-            self.preview_buffer.update_preview(U, dT)
-            # <dirty why="used in PreviewDrawer">
-            self.preview_buffer.nb_steps = self.nb_mpc_steps
-            self.preview_buffer.switch_step = self.preview_control.switch_step
-            # </dirty>
+            self.preview_buffer.update_preview(
+                U, dT, switch_step=self.preview_control.switch_step)
         except ValueError:
             print("MPC couldn't solve QP, constraints may be inconsistent")
 
@@ -612,21 +608,37 @@ class PreviewBuffer(pymanoid.Process):
 
     def __init__(self, u_dim, callback=None):
         super(PreviewBuffer, self).__init__()
-        self._U = None
-        self._dT = None
+        self._cur_preview = None
         self._default_control = (zeros(u_dim), 0.1)
+        self._default_control[0].flags.writeable = False
+        self._preview = None
         self.callback = callback
         self.cur_control = None
         self.cur_index = 0
-        self.lock = Lock()
-        self.nb_steps = 0
         self.rem_time = 0.
-        self.switch_step = None
         self.u_dim = u_dim
 
     @property
     def is_empty(self):
-        return self._U is None
+        return self._preview is None
+
+    @property
+    def preview(self):
+        """
+        Snapshot ``(U, dT, nb_steps, switch_step)`` of the current preview,
+        or ``None`` if the buffer is empty.
+        """
+        return self._preview
+
+    @property
+    def nb_steps(self):
+        preview = self._preview
+        return preview[2] if preview is not None else 0
+
+    @property
+    def switch_step(self):
+        preview = self._preview
+        return preview[3] if preview is not None else None
 
     def update_preview(self, U, dT, switch_step=None):
         """
@@ -640,23 +652,22 @@ class PreviewBuffer(pymanoid.Process):
             Sequence of durations, one for each preview control.
         switch_step : int, optional
             Optional index of a contact-switch step in the sequence.
+
+        Notes
+        -----
+        The new preview, including its number of steps and switch step, is
+        published by a single attribute assignment, which is atomic in
+        CPython, so that readers get a consistent snapshot without locking.
+        The read index is reset by the reader when it sees a new preview.
         """
-        with self.lock:
-            self._U = U
-            self._dT = dT
-            self.cur_index = 0
-            self.nb_steps = len(dT)
-            self.rem_time = 0.
-            self.switch_step = switch_step
+        self._preview = (U, dT, len(dT), switch_step)
+        self.rem_time = 0.
 
     def reset(self):
         """Reset preview buffer to its empty state."""
-        with self.lock:
-            self._U = None
-            self._dT = None
-            self.cur_control = None
-            self.cur_index = 0
-            self.rem_time = 0.
+        self._preview = None
+        self.cur_control = None
+        self.rem_time = 0.
 
     def get_next_control(self):
         """
@@ -667,16 +678,20 @@ class PreviewBuffer(pymanoid.Process):
         (u, dT) : array, scalar
             Next control in the preview window.
         """
-        with self.lock:
-            if self.is_empty:
-                return self._default_control
-            j = self.u_dim * self.cur_index
-            u = self._U[j:j + self.u_dim]
-            if u.shape[0] == 0:
-                return self._default_control
-            dT = self._dT[self.cur_index]
-            self.cur_index += 1
-            return (u, dT)
+        preview = self._preview
+        if preview is None:
+            return self._default_control
+        if preview is not self._cur_preview:
+            self._cur_preview = preview
+            self.cur_index = 0
+        U, dT = preview[0], preview[1]
+        j = self.u_dim * self.cur_index
+        u = U[j:j + self.u_dim]
+        if u.shape[0] == 0:
+            return self._default_control
+        dT = dT[self.cur_index]
+        self.cur_index += 1
+        return (u, dT)
 
     def on_tick(self, sim):
         """
@@ -717,22 +732,24 @@ class PreviewDrawer(pymanoid.Process):
         sim : Simulation
             Instance of the current simulation.
         """
-        if preview_buffer.is_empty:
+        preview = preview_buffer.preview
+        if preview is None:
             return
+        U, dT_list, nb_steps, switch_step = preview
         com_pre, comd_pre = com_target.p, com_target.pd
         com_free, comd_free = com_target.p, com_target.pd
         self.handles = []
         self.handles.append(
             draw_point(com_target.p, color='m', pointsize=0.007))
-        for preview_index in range(preview_buffer.nb_steps):
+        for preview_index in range(nb_steps):
             com_pre0 = com_pre
             j = 3 * preview_index
-            comdd = preview_buffer._U[j:j + 3]
-            dT = preview_buffer._dT[preview_index]
+            comdd = U[j:j + 3]
+            dT = dT_list[preview_index]
             com_pre = com_pre + comd_pre * dT + comdd * .5 * dT ** 2
             comd_pre += comdd * dT
             color = \
-                'b' if preview_index <= preview_buffer.switch_step \
+                'b' if preview_index <= switch_step \
                 else 'y'
             self.handles.append(
                 draw_point(com_pre, color=color, pointsize=0.005))
@@ -17,8 +17,9 @@
 # You should have received a copy of the GNU General Public License along with
 # pymanoid. If not, see <http://www.gnu.org/licenses/>.
 
-from numpy import array, ndarray
-from numpy import cross, diag, dot, eye, hstack, sqrt, vstack, zeros
+from numpy import array, ascontiguousarray, ndarray
+from numpy import cross, diag, dot, empty, eye, hstack, sqrt, tile, vstack
+from numpy import zeros
 from scipy.linalg import block_diag
 
 from .body import Box
@@ -71,6 +72,11 @@ class Contact(Box):
         self.max_pressure = None
         self.shape = shape
         self.wrench = None
+        self.__grasp_matrix = eye(6)
+        self.__local_corners = None
+        self.__local_corners_key = None
+        self.__local_wrench_cone = None
+        self.__local_wrench_cone_key = None
 
     def copy(self, link=None, hide=False):
         """
@@ -102,6 +108,34 @@ class Contact(Box):
             'shape': list(self.shape),
         }
 
+    @property
+    def friction(self):
+        """
+        Static friction coefficient.
+        """
+        return self.__friction
+
+    @friction.setter
+    def friction(self, friction):
+        self.__friction = friction
+        if friction is None:
+            self.__inner_friction = None
+            self.__local_force_hrep = None
+            self.__local_force_rays = None
+            return
+        mu = friction / sqrt(2)  # inner approximation
+        self.__inner_friction = mu
+        self.__local_force_hrep = array([
+            [-1, 0, -mu],
+            [+1, 0, -mu],
+            [0, -1, -mu],
+            [0, +1, -mu]])
+        self.__local_force_rays = array([
+            [+mu, +mu, +1],
+            [+mu, -mu, +1],
+            [-mu, +mu, +1],
+            [-mu, -mu, +1]])
+
     @property
     def force(self):
         """
@@ -131,31 +165,25 @@ class Contact(Box):
         approximation. See for instance this `introduction to friction cones
         <https://scaron.info/teaching/friction-cones.html>`_ for details.
         """
-        mu = self.friction / sqrt(2)
-        hrep_local = array([
-            [-1, 0, -mu],
-            [+1, 0, -mu],
-            [0, -1, -mu],
-            [0, +1, -mu]])
-        return dot(hrep_local, self.R.T)
+        return dot(self.__local_force_hrep, self.R.T)
 
     @property
     def force_rays(self):
         """
         Rays of the force friction cone in the world frame.
 
+        Returns
+        -------
+        rays : array, shape=(4, 3)
+            Force rays, stacked row by row.
+
         Notes
         -----
         All linearized friction cones in pymanoid use the inner (conservative)
         approximation. See for instance this `introduction to friction cones
         <https://scaron.info/teaching/friction-cones.html>`_ for details.
         """
-        mu = self.friction / sqrt(2)
-        f1 = dot(self.R, [+mu, +mu, +1])
-        f2 = dot(self.R, [+mu, -mu, +1])
-        f3 = dot(self.R, [-mu, +mu, +1])
-        f4 = dot(self.R, [-mu, -mu, +1])
-        return [f1, f2, f3, f4]
+        return dot(self.__local_force_rays, self.R.T)
 
     @property
     def force_span(self):
@@ -174,7 +202,7 @@ class Contact(Box):
         approximation. See for instance this `introduction to friction cones
         <https://scaron.info/teaching/friction-cones.html>`_ for details.
         """
-        return array(self.force_rays).T
+        return self.force_rays.T
 
     def compute_grasp_matrix(self, p):
         """
@@ -200,21 +228,45 @@ class Contact(Box):
             Grasp matrix :math:`G_P`.
         """
         x, y, z = self.p - p
-        return array([
-            # fx fy  fz taux tauy tauz
-            [1,   0,  0,   0,   0,   0],
-            [0,   1,  0,   0,   0,   0],
-            [0,   0,  1,   0,   0,   0],
-            [0,  -z,  y,   1,   0,   0],
-            [z,   0, -x,   0,   1,   0],
-            [-y,  x,  0,   0,   0,   1]])
+        G = self.__grasp_matrix  # only off-diagonal entries change
+        G[3, 1], G[3, 2] = -z, y
+        G[4, 0], G[4, 2] = z, -x
+        G[5, 0], G[5, 1] = -y, x
+        return G.copy()
+
+    def compute_wrench_span(self, p):
+        """
+        Compute the span matrix of the contact wrench cone at a given point.
+
+        Parameters
+        ----------
+        p : array, shape=(3,)
+            Point, in world frame coordinates, where the wrench is taken.
+
+        Returns
+        -------
+        S : array, shape=(6, 16)
+            Span matrix :math:`S_P` of the contact wrench cone, with columns
+            ordered by contact vertex, then by force ray.
+
+        Notes
+        -----
+        Taking wrench rays at `P` directly from the vertex offsets
+        :math:`v - p` is equivalent to, but cheaper than, left-multiplying
+        the span matrix at the contact point by the grasp matrix :math:`G_P`.
+        """
+        return compute_batch_wrench_span([self], p)[0]
 
     @property
     def vertices(self):
         """
         Vertices of the contact area.
         """
-        return self.get_scaled_contact_area(1.)
+        key = tuple(self.shape)
+        if key != self.__local_corners_key:
+            self.__local_corners = self.__compute_local_corners(1.)
+            self.__local_corners_key = key
+        return list(dot(self.T, self.__local_corners)[:3].T)
 
     def get_scaled_contact_area(self, scale):
         """
@@ -230,13 +282,21 @@ class Contact(Box):
         vertices : list of arrays
             List of vertex coordinates in the world frame.
         """
+        local_corners = self.__compute_local_corners(scale)
+        return list(dot(self.T, local_corners)[:3].T)
+
+    def __compute_local_corners(self, scale):
+        """
+        Homogeneous coordinates of the scaled contact area in the contact
+        frame, stacked column-wise.
+        """
         X = scale * self.shape[0]
         Y = scale * self.shape[1]
-        v1 = dot(self.T, array([+X, +Y, 0., 1.]))[:3]
-        v2 = dot(self.T, array([+X, -Y, 0., 1.]))[:3]
-        v3 = dot(self.T, array([-X, -Y, 0., 1.]))[:3]
-        v4 = dot(self.T, array([-X, +Y, 0., 1.]))[:3]
-        return [v1, v2, v3, v4]
+        return array([
+            [+X, +X, -X, -X],
+            [+Y, -Y, -Y, +Y],
+            [0., 0., 0., 0.],
+            [1., 1., 1., 1.]])
 
     def set_wrench(self, wrench):
         """
@@ -258,7 +318,8 @@ class Contact(Box):
         if not self.is_managed:
             self.set_color('b')
         self.is_managed = True
-        self.wrench = dot(block_diag(self.R, self.R), wrench)
+        R = self.R
+        self.wrench = hstack([dot(R, wrench[:3]), dot(R, wrench[3:])])
 
     def unset_wrench(self):
         """
@@ -306,8 +367,24 @@ class Contact(Box):
         the world frame. See [Caron15]_ for the derivation of the formula for
         `F`.
         """
+        local_cone = self.__get_local_wrench_cone()
+        R_T = self.R.T
+        F = empty(local_cone.shape)
+        # block_diag(R.T, R.T) has zero off-diagonal blocks
+        F[:, :3] = dot(local_cone[:, :3], R_T)
+        F[:, 3:] = dot(local_cone[:, 3:], R_T)
+        return F
+
+    def __get_local_wrench_cone(self):
+        """
+        Friction inequalities in the contact frame, recomputed only when the
+        contact shape or friction coefficient change.
+        """
         X, Y = self.shape
-        mu = self.friction / sqrt(2)  # inner approximation
+        key = (X, Y, self.friction)
+        if key == self.__local_wrench_cone_key:
+            return self.__local_wrench_cone
+        mu = self.__inner_friction  # inner approximation
         local_cone = array([
             # fx fy             fz taux tauy tauz
             [-1,  0,           -mu,   0,   0,   0],
@@ -326,7 +403,9 @@ class Contact(Box):
             [+Y, -X, -(X + Y) * mu, +mu, -mu,  +1],
             [-Y, +X, -(X + Y) * mu, -mu, +mu,  +1],
             [-Y, -X, -(X + Y) * mu, -mu, -mu,  +1]])
-        return dot(local_cone, block_diag(self.R.T, self.R.T))
+        self.__local_wrench_cone = local_cone
+        self.__local_wrench_cone_key = key
+        return local_cone
 
     @property
     def wrench_hrep(self):
@@ -359,11 +438,14 @@ class Contact(Box):
     def wrench_rays(self):
         """
         Rays (V-rep) of the contact wrench cone in world frame.
+
+        Returns
+        -------
+        rays : array, shape=(16, 6)
+            Wrench rays, stacked row by row and ordered by contact vertex,
+            then by force ray.
         """
-        return [
-            hstack([f, cross(v - self.p, f)])
-            for v in self.vertices
-            for f in self.force_rays]
+        return ascontiguousarray(self.compute_wrench_span(self.p).T)
 
     @property
     def wrench_span(self):
@@ -392,9 +474,44 @@ class Contact(Box):
         contact points (one for each vertex of the rectangular area) with
         4-sided friction pyramids at each.
         """
-        return hstack([
-            dot(vstack([eye(3), crossmat(v - self.p)]), self.force_span)
-            for v in self.vertices])
+        return self.compute_wrench_span(self.p)
+
+
+def compute_batch_wrench_span(contacts, p=None):
+    """
+    Compute span matrices of the wrench cones of several contacts at once.
+
+    Parameters
+    ----------
+    contacts : list of Contact
+        List of contacts.
+    p : array, shape=(3,), optional
+        Point where wrench coordinates are taken. Defaults to the contact
+        point of each contact.
+
+    Returns
+    -------
+    spans : array, shape=(nb_contacts, 6, 16)
+        Span matrices of the contact wrench cones, such that ``spans[i]`` is
+        equal to ``contacts[i].compute_wrench_span(p)``.
+
+    Notes
+    -----
+    Torques of all wrench rays are computed by a single cross product of the
+    stacked vertex offsets with the stacked force rays of all contacts.
+    """
+    nb_contacts = len(contacts)
+    force_rays = array([contact.force_rays for contact in contacts])
+    vertices = array([contact.vertices for contact in contacts])
+    if p is None:
+        p = array([contact.p for contact in contacts])[:, None, :]
+    offsets = vertices - p  # shape=(nc, 4, 3)
+    torques = cross(offsets[:, :, None, :], force_rays[:, None, :, :])
+    spans = empty((nb_contacts, 6, 16))
+    spans[:, :3, :] = tile(force_rays.transpose((0, 2, 1)), (1, 1, 4))
+    spans[:, 3:, :] = torques.reshape((nb_contacts, 16, 3)).transpose(
+        (0, 2, 1))
+    return spans
 
 
 class ContactSet(object):
@@ -513,20 +630,8 @@ class ContactSet(object):
 
         where :math:`w_P` denotes the contact-wrench coordinates at point `P`.
         """
-        span_blocks = []
-        for contact in self.contacts:
-            x, y, z = contact.p - p
-            Gi = array([
-                [1,  0,  0, 0, 0, 0],
-                [0,  1,  0, 0, 0, 0],
-                [0,  0,  1, 0, 0, 0],
-                [0, -z,  y, 1, 0, 0],
-                [z,  0, -x, 0, 1, 0],
-                [-y, x,  0, 0, 0, 1]])
-            span_blocks.append(dot(Gi, contact.wrench_span))
-        S = hstack(span_blocks)
-        assert S.shape == (6, 16 * self.nb_contacts)
-        return S
+        spans = compute_batch_wrench_span(self.contacts, p)
+        return spans.transpose((1, 0, 2)).reshape((6, 16 * self.nb_contacts))
 
     def find_supporting_wrenches(self, wrench, point, friction_weight=1e-2,
                                  cop_weight=1., yaw_weight=1e-4,
@@ -582,7 +687,8 @@ class ContactSet(object):
         A = hstack([contact.compute_grasp_matrix(point)
                     for contact in self.supporting_contacts])
         b = wrench + ext_wrench  # A * x == b
-        w_all = solve_qp(P, q, G, h, A, b, solver=solver)
+        # P is symmetric by construction
+        w_all = solve_qp(P, q, G, h, A, b, solver=solver, sym_proj=False)
         if w_all is None:
             return None
         support = [
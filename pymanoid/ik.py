@@ -17,7 +17,9 @@
 # You should have received a copy of the GNU General Public License along with
 # pymanoid. If not, see <http://www.gnu.org/licenses/>.
 
-from numpy import dot, eye, hstack, maximum, minimum, ones, sqrt, vstack, zeros
+from numpy import array, dot, eye, hstack, maximum, minimum, ones, sqrt
+from numpy import tril_indices, vstack, zeros
+from scipy.linalg.blas import dgemv, dsyrk
 from threading import Lock
 
 from .misc import norm
@@ -110,6 +112,7 @@ class IKSolver(Process):
             active_dofs = range(robot.nb_dofs)
         assert 0. <= doflim_gain <= 1.
         self.__lock = Lock()
+        self.__qp_G_cache = {}
         self.doflim_gain = doflim_gain
         self.interaction_dist = 0.1  # [rad]
         self.lm_damping = 1e-3
@@ -139,19 +142,28 @@ class IKSolver(Process):
         active_dofs : list of integers
             List of DOF indices.
         """
+        n = len(active_dofs)
+        self.__dof_indices = array(active_dofs, dtype=int)
+        if n not in self.__qp_G_cache:
+            self.__qp_G_cache[n] = vstack([+eye(n), -eye(n)])
+        self.__qp_G = self.__qp_G_cache[n]
+        self.__qp_h = zeros(2 * n)
+        self.__qp_P = zeros((n, n), order='F')
+        self.__qp_P_lower = tril_indices(n, -1)
+        self.__qp_q = zeros(n)
         self.active_dofs = active_dofs
-        self.nb_active_dofs = len(active_dofs)
+        self.nb_active_dofs = n
         self.__reset_dof_limits()
 
     def __reset_dof_limits(self):
         """
         Read DOF position, velocity and acceleration limits from robot model.
         """
-        self.q_max = self.robot.q_max[self.active_dofs]
-        self.q_min = self.robot.q_min[self.active_dofs]
-        self.qd_lim = self.robot.qd_lim[self.active_dofs]
+        self.q_max = self.robot.q_max[self.__dof_indices]
+        self.q_min = self.robot.q_min[self.__dof_indices]
+        self.qd_lim = self.robot.qd_lim[self.__dof_indices]
         if self.robot.qdd_lim is not None:
-            self.qdd_lim = self.robot.qdd_lim[self.active_dofs]
+            self.qdd_lim = self.robot.qdd_lim[self.__dof_indices]
         else:  # robot model has no joint acceleration limit
             self.qdd_lim = None
 
@@ -295,24 +307,33 @@ class IKSolver(Process):
         cannot brake fast enough to avoid a collision in the future due to
         acceleration limits. This function implements the solution to this
         problem described in Equation (14) of [Flacco15]_.
+
+        The cost matrix and vector are written to buffers owned by the solver,
+        which are overwritten at the next call. Copy them if you need to keep
+        them around.
         """
         n = self.nb_active_dofs
-        P = zeros((n, n))
-        v = zeros(n)
+        P, v = self.__qp_P, self.__qp_q
+        P.fill(0.)
+        v.fill(0.)
         with self.__lock:
             for task in self.tasks.itervalues():
-                J = task.jacobian()[:, self.active_dofs]
+                J = task.jacobian()[:, self.__dof_indices]
                 r = task.residual(dt)
                 mu = self.lm_damping * max(1e-3, dot(r, r))
-                P += task.weight * (dot(J.T, J) + mu * eye(n))
-                v += task.weight * dot(-r.T, J)
-        q = self.robot.q[self.active_dofs]
+                # accumulate in place: P += w * J^T J (upper triangle only)
+                P = dsyrk(task.weight, J, beta=1., c=P, trans=1, overwrite_c=1)
+                P.flat[::n + 1] += task.weight * mu
+                v = dgemv(-task.weight, J, r, beta=1., y=v, trans=1,
+                          overwrite_y=1)
+        P[self.__qp_P_lower] = P.T[self.__qp_P_lower]
+        q = self.robot.q[self.__dof_indices]
         qd_max_doflim = (self.q_max - q) / dt
         qd_min_doflim = (self.q_min - q) / dt
         qd_max = minimum(+self.qd_lim, self.doflim_gain * qd_max_doflim)
         qd_min = maximum(-self.qd_lim, self.doflim_gain * qd_min_doflim)
         if self.qdd_lim is not None:  # straightforward acceleration bounds
-            qd = self.robot.qd[self.active_dofs]
+            qd = self.robot.qd[self.__dof_indices]
             qd_max_acc = qd + self.qdd_lim * dt
             qd_min_acc = qd - self.qdd_lim * dt
             qd_max = minimum(qd_max, qd_max_acc)
@@ -368,11 +389,12 @@ class IKSolver(Process):
         """
         n = self.nb_active_dofs
         P, v, qd_max, qd_min = self.build_qp_matrices(dt)
-        G = vstack([+eye(n), -eye(n)])
-        h = hstack([qd_max, -qd_min])
+        h = self.__qp_h
+        h[:n] = qd_max
+        h[n:] = -qd_min
         try:
-            x = solve_qp(P, v, G, h)
-            self.qd[self.active_dofs] = x
+            x = solve_qp(P, v, self.__qp_G, h, sym_proj=False)  # P symmetric
+            self.qd[self.__dof_indices] = x
         except ValueError as e:
             if "matrix G is not positive definite" in e:
                 raise Exception(RANK_DEFICIENCY_MSG)
@@ -416,8 +438,8 @@ class IKSolver(Process):
             hstack([+E, +E / dt]), hstack([-E, +E / dt]), hstack([Z, -E])])
         h = hstack([qd_max, -qd_min, zeros(n)])
         try:
-            x = solve_qp(P, v, G, h)
-            self.qd[self.active_dofs] = x[:n]
+            x = solve_qp(P, v, G, h, sym_proj=False)  # P is symmetric
+            self.qd[self.__dof_indices] = x[:n]
         except ValueError as e:
             if "matrix G is not positive definite" in e:
                 raise Exception(RANK_DEFICIENCY_MSG)
@@ -486,7 +508,7 @@ class IKSolver(Process):
         if exploration_phase:
             self.lm_damping = 0
             self.slack_dof_limits = False
-            self.qd_lim = 10. * self.robot.qd_lim[self.active_dofs]
+            self.qd_lim = 10. * self.robot.qd_lim[self.__dof_indices]
             self.qdd_lim = None
         for itnum in range(max_it):
             prev_cost = cost
@@ -500,7 +522,7 @@ class IKSolver(Process):
                 exploration_phase = False
                 self.lm_damping = init_lm_damping
                 self.slack_dof_limits = init_slack_dof_limits
-                self.qd_lim = self.robot.qd_lim[self.active_dofs]
+                self.qd_lim = self.robot.qd_lim[self.__dof_indices]
             self.step(dt)
         self.lm_damping = init_lm_damping
         self.slack_dof_limits = init_slack_dof_limits
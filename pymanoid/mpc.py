@@ -17,12 +17,20 @@
 # You should have received a copy of the GNU General Public License along with
 # pymanoid. If not, see <http://www.gnu.org/licenses/>.
 
-from numpy import dot, eye, hstack, vstack, zeros
+from collections import OrderedDict
+from numpy import arange, array, dot, empty, eye, hstack, matmul, tile
+from numpy import tril_indices, vstack, zeros
+from numpy.linalg import solve
+from scipy.linalg.blas import dgemv, dsyrk
+from threading import Lock
 from time import time
 
 from .qpsolvers import solve_qp
 
 
+WARM_START_SOLVERS = ['cvxopt', 'osqp']
+
+
 class LinearPredictiveControl(object):
 
     """
@@ -94,8 +102,19 @@ class LinearPredictiveControl(object):
     value problems: single shooting, multiple shooting and collocation. The
     solver implemented in this class follows the `single shooting method
     <https://en.wikipedia.org/wiki/Shooting_method>`_.
+
+    State maps :math:`\\Phi_k` and :math:`\\Psi_k` only depend on `A`, `B`
+    and `nb_steps`, and the QP cost matrix on these and the cost weights.
+    They are cached across instances, so that re-creating a controller at
+    each control cycle with the same dynamics only pays for the QP vectors
+    that depend on the initial and goal states.
     """
 
+    CACHE_SIZE = 16
+
+    __cache = OrderedDict()
+    __cache_lock = Lock()
+
     def __init__(self, A, B, C, D, e, x_init, x_goal, nb_steps, wxt=None,
                  wxc=None, wu=1e-3):
         assert C is not None or D is not None, "use LQR for unconstrained case"
@@ -138,48 +157,248 @@ class LinearPredictiveControl(object):
         :math:`\\Psi`, as we use similar notations below.
         """
         t_build_start = time()
-        phi = eye(self.x_dim)
-        psi = zeros((self.x_dim, self.U_dim))
+        A_pow, psi_stack = self.__compute_state_maps()
+        if type(self.C) is not list and type(self.D) is not list:
+            self.G, self.h = self.__compute_shared_constraints(
+                A_pow, psi_stack)
+        else:  # per-step constraint matrices
+            self.G, self.h = self.__compute_step_constraints(
+                A_pow, psi_stack)
+        phi, psi = A_pow[self.nb_steps], psi_stack[self.nb_steps]
+        q = zeros(self.U_dim)
+        if self.wxt is not None and self.wxt > 1e-10:
+            c = dot(phi, self.x_init) - self.x_goal
+            q = dgemv(self.wxt, psi, c, beta=1., y=q, trans=1, overwrite_y=1)
+        if self.wxc is not None and self.wxc > 1e-10:
+            Phi = A_pow[:-1].reshape((self.nb_steps * self.x_dim, self.x_dim))
+            Psi = psi_stack[:-1].reshape((self.nb_steps * self.x_dim, -1))
+            X_goal = hstack([self.x_goal] * self.nb_steps)
+            c = dot(Phi, self.x_init) - X_goal
+            q = dgemv(self.wxc, Psi, c, beta=1., y=q, trans=1, overwrite_y=1)
+        self.P = self.__compute_cost_matrix(psi_stack).copy()
+        self.q = q
+        self.build_time = time() - t_build_start
+
+    def __compute_shared_constraints(self, A_pow, psi_stack):
+        """
+        Compute inequality constraints of the preview QP when matrices `C`
+        and `D` are the same at every step.
+
+        Parameters
+        ----------
+        A_pow : array, shape=(nb_steps + 1, n, n)
+            Matrices :math:`\\Phi_k` such that :math:`x_k = \\Phi_k
+            x_\\mathrm{init} + \\Psi_k U`.
+        psi_stack : array, shape=(nb_steps + 1, n, U_dim)
+            Matrices :math:`\\Psi_k` such that :math:`x_k = \\Phi_k
+            x_\\mathrm{init} + \\Psi_k U`.
+
+        Returns
+        -------
+        G : array, shape=(nb_steps * m, U_dim)
+            Inequality constraint matrix.
+        h : array, shape=(nb_steps * m,)
+            Inequality constraint vector.
+        """
+        N = self.nb_steps
+        e = array(self.e) if type(self.e) is list else tile(self.e, (N, 1))
+        m = e.shape[1]
+        G = zeros((N, m, N, self.u_dim))
+        if self.D is not None:
+            k = arange(N)
+            G[k, :, k, :] = self.D
+        G = G.reshape((N * m, self.U_dim))
+        h = e
+        if self.C is not None:
+            G += matmul(self.C, psi_stack[:N]).reshape((N * m, self.U_dim))
+            h = e - dot(matmul(self.C, A_pow[:N]), self.x_init)
+        return G, h.flatten()
+
+    def __compute_step_constraints(self, A_pow, psi_stack):
+        """
+        Compute inequality constraints of the preview QP step by step.
+
+        Parameters
+        ----------
+        A_pow : array, shape=(nb_steps + 1, n, n)
+            Matrices :math:`\\Phi_k` such that :math:`x_k = \\Phi_k
+            x_\\mathrm{init} + \\Psi_k U`.
+        psi_stack : array, shape=(nb_steps + 1, n, U_dim)
+            Matrices :math:`\\Psi_k` such that :math:`x_k = \\Phi_k
+            x_\\mathrm{init} + \\Psi_k U`.
+
+        Returns
+        -------
+        G : array, shape=(m, U_dim)
+            Inequality constraint matrix.
+        h : array, shape=(m,)
+            Inequality constraint vector.
+        """
         G_list, h_list = [], []
-        phi_list, psi_list = [], []
         for k in range(self.nb_steps):
-            # Loop invariant: x == psi * U + phi * x_init
-            if self.wxc is not None:
-                phi_list.append(phi)
-                psi_list.append(psi)
+            # Invariant: x_k == psi_stack[k] * U + A_pow[k] * x_init
             C = self.C[k] if type(self.C) is list else self.C
             D = self.D[k] if type(self.D) is list else self.D
             e = self.e[k] if type(self.e) is list else self.e
             G = zeros((e.shape[0], self.U_dim))
-            h = e if C is None else e - dot(dot(C, phi), self.x_init)
+            h = e if C is None else e - dot(dot(C, A_pow[k]), self.x_init)
             if D is not None:
                 # we rely on G == 0 to avoid a slower +=
                 G[:, k * self.u_dim:(k + 1) * self.u_dim] = D
             if C is not None:
-                G += dot(C, psi)
+                G += dot(C, psi_stack[k])
             G_list.append(G)
             h_list.append(h)
-            phi = dot(self.A, phi)
-            psi = dot(self.A, psi)
-            psi[:, self.u_dim * k:self.u_dim * (k + 1)] = self.B
-        P = self.wu * eye(self.U_dim)
-        q = zeros(self.U_dim)
-        if self.wxt is not None and self.wxt > 1e-10:
-            c = dot(phi, self.x_init) - self.x_goal
-            P += self.wxt * dot(psi.T, psi)
-            q += self.wxt * dot(c.T, psi)
-        if self.wxc is not None and self.wxc > 1e-10:
-            Phi = vstack(phi_list)
-            Psi = vstack(psi_list)
-            X_goal = hstack([self.x_goal] * self.nb_steps)
-            c = dot(Phi, self.x_init) - X_goal
-            P += self.wxc * dot(Psi.T, Psi)
-            q += self.wxc * dot(c.T, Psi)
-        self.P = P
-        self.q = q
-        self.G = vstack(G_list)
-        self.h = hstack(h_list)
-        self.build_time = time() - t_build_start
+        return vstack(G_list), hstack(h_list)
+
+    def __compute_state_maps(self):
+        """
+        Compute the matrices mapping initial state and controls to states.
+
+        Returns
+        -------
+        A_pow : array, shape=(nb_steps + 1, n, n)
+            Powers :math:`A^k` of the state matrix, i.e. :math:`\\Phi_k`.
+        psi_stack : array, shape=(nb_steps + 1, n, U_dim)
+            Matrices :math:`\\Psi_k` such that :math:`x_k = \\Phi_k
+            x_\\mathrm{init} + \\Psi_k U`.
+
+        Notes
+        -----
+        Each :math:`\\Psi_k` is a block row of the block-Toeplitz matrix
+        whose lower blocks are :math:`A^{k - 1 - j} B`, where `j` is the
+        index of the control block. All blocks are filled in a single
+        assignment from the stacked products :math:`A^i B`.
+
+        Returned arrays are shared between instances and read-only.
+        """
+        return self.__get_cached(
+            ('state_maps',) + self.__dynamics_key,
+            self.__build_state_maps)
+
+    def __build_state_maps(self):
+        N = self.nb_steps
+        A_pow = empty((N + 1, self.x_dim, self.x_dim))
+        A_pow[0] = eye(self.x_dim)
+        for k in range(N):
+            A_pow[k + 1] = dot(self.A, A_pow[k])
+        AB_pow = matmul(A_pow[:N], self.B)  # A^i B for i < N
+        psi_stack = zeros((N + 1, self.x_dim, N, self.u_dim))
+        k, j = tril_indices(N + 1, -1)  # all pairs with j < k
+        psi_stack[k, :, j, :] = AB_pow[k - 1 - j]
+        psi_stack = psi_stack.reshape((N + 1, self.x_dim, self.U_dim))
+        A_pow.flags.writeable = False
+        psi_stack.flags.writeable = False
+        return (A_pow, psi_stack)
+
+    def __compute_cost_matrix(self, psi_stack):
+        """
+        Compute the cost matrix of the preview QP.
+
+        Parameters
+        ----------
+        psi_stack : array, shape=(nb_steps + 1, n, U_dim)
+            Matrices :math:`\\Psi_k` such that :math:`x_k = \\Phi_k
+            x_\\mathrm{init} + \\Psi_k U`.
+
+        Returns
+        -------
+        P : array, shape=(U_dim, U_dim)
+            Cost matrix, shared between instances and read-only.
+        """
+        def build_cost_matrix():
+            P = zeros((self.U_dim, self.U_dim), order='F')
+            if self.wxt is not None and self.wxt > 1e-10:
+                psi = psi_stack[self.nb_steps]
+                P = dsyrk(self.wxt, psi, beta=1., c=P, trans=1, overwrite_c=1)
+            if self.wxc is not None and self.wxc > 1e-10:
+                Psi = psi_stack[:-1].reshape((self.nb_steps * self.x_dim, -1))
+                P = dsyrk(self.wxc, Psi, beta=1., c=P, trans=1, overwrite_c=1)
+            i_lower = tril_indices(self.U_dim, -1)
+            P[i_lower] = P.T[i_lower]  # syrk only fills the upper triangle
+            P.flat[::self.U_dim + 1] += self.wu
+            P.flags.writeable = False
+            return P
+
+        return self.__get_cached(
+            ('cost_matrix', self.wxt, self.wxc, self.wu) + self.__dynamics_key,
+            build_cost_matrix)
+
+    @property
+    def __dynamics_key(self):
+        return (self.A.shape, self.A.tobytes(), self.B.shape, self.B.tobytes(),
+                self.nb_steps)
+
+    def __get_cached(self, key, build):
+        """
+        Get a value from the cache shared by all instances, building it if
+        it is not there yet.
+
+        Parameters
+        ----------
+        key : tuple
+            Cache key.
+        build : function
+            Function called without arguments to compute a missing value.
+
+        Returns
+        -------
+        value : object
+            Cached value.
+        """
+        with self.__cache_lock:
+            value = self.__cache.pop(key, None)
+            if value is not None:  # re-insert as most recently used
+                self.__cache[key] = value
+                return value
+        value = build()
+        with self.__cache_lock:
+            self.__cache[key] = value
+            while len(self.__cache) > self.CACHE_SIZE:
+                self.__cache.popitem(last=False)
+        return value
+
+    def compute_lqr_controls(self):
+        """
+        Compute the series of controls that minimizes the preview cost when
+        inequality constraints are ignored.
+
+        Returns
+        -------
+        U : array, shape=(U_dim,)
+            Stacked vector of unconstrained optimal controls.
+
+        Notes
+        -----
+        This solution is computed by a backward Riccati recursion on the
+        state error :math:`e_k = x_k - x_\\mathrm{goal}`, whose dynamics
+        :math:`e_{k+1} = A e_k + B u_k + (A - I) x_\\mathrm{goal}` are
+        affine. Its cost is linear in `nb_steps` rather than cubic for a
+        dense solve of the QP cost, which makes it a cheap warm start for QP
+        solvers that support it.
+        """
+        A, B, n = self.A, self.B, self.x_dim
+        wxc = self.wxc if self.wxc is not None else 0.
+        wxt = self.wxt if self.wxt is not None else 0.
+        d = dot(A, self.x_goal) - self.x_goal
+        P = wxt * eye(n)
+        s = zeros(n)
+        gains = []
+        for _ in range(self.nb_steps):
+            BtP = dot(B.T, P)
+            H = self.wu * eye(self.u_dim) + dot(BtP, B)
+            K = solve(H, dot(BtP, A))
+            k_ff = solve(H, dot(BtP, d) + dot(B.T, s))
+            A_cl = A - dot(B, K)
+            s = dot(A_cl.T, dot(P, d) + s)
+            P = wxc * eye(n) + dot(A.T, dot(P, A_cl))
+            gains.append((K, k_ff))
+        e = self.x_init - self.x_goal
+        U = zeros((self.nb_steps, self.u_dim))
+        for (k, (K, k_ff)) in enumerate(reversed(gains)):
+            U[k] = -dot(K, e) - k_ff
+            e = dot(A, e) + dot(B, U[k]) + d
+        return U.flatten()
 
     def solve(self, **kwargs):
         """
@@ -194,6 +413,9 @@ class LinearPredictiveControl(object):
         """
         t_solve_start = time()
         kwargs['sym_proj'] = False  # self.P is symmetric
+        if 'initvals' not in kwargs and \
+                kwargs.get('solver') in WARM_START_SOLVERS:
+            kwargs['initvals'] = self.compute_lqr_controls()
         U = solve_qp(self.P, self.q, self.G, self.h, **kwargs)
         self.U = U.reshape((self.nb_steps, self.u_dim))
         self.solve_time = time() - t_solve_start